@@ -1,11 +1,43 @@
 import argparse
 import logging
+import logging.handlers
 import math
 import os
+import random
+import shelve
+import shutil
 import sys
+import tempfile
+import threading
 import time
 
-from src import BIMcloudAPI, GoogleDriveAPI, NotionAPI
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src import AuthError, BIMcloudAPI, GoogleDriveAPI, NotionAPI, cache_dir, dumps
+
+# backup file extensions by resource type, suffixed with the server version
+EXTENSIONS = {
+	'project': '.bimproject',
+	'library': '.bimlibrary',
+}
+
+# static criterion of the resources to back up, serialized once
+_RESOURCE_CRITERION = dumps({
+	'$or': [
+		{'$eq': {'type': 'project'}},
+		{'$eq': {'type': 'library'}},
+	]
+})
+
+def positive_int(value: str) -> int:
+	""" Argparse type accepting whole numbers above zero only. """
+	try:
+		number = int(value)
+	except ValueError:
+		raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+	if number <= 0:
+		raise argparse.ArgumentTypeError(f"must be greater than 0: {number}")
+	return number
 
 def setup(arg):
 	"""
@@ -19,17 +51,21 @@ def setup(arg):
 	shell_log = LogHandler(logging.StreamHandler(sys.stdout))
 	shell_log.setFormatter(formatter)
 	shell_log.setLevel(logging.INFO)
+	if not sys.stdout.isatty(): # e.g. cron or a redirect, inline updates are just noise there
+		shell_log.addFilter(NoProgressFilter())
 	logger.addHandler(shell_log)
 
 	root = os.path.dirname(os.path.abspath(__file__))
 
-	file_log_full = logging.FileHandler(os.path.join(root, "job_backup.log"), mode='w')
+	file_log_full = logging.FileHandler(os.path.join(root, "job_backup.log"), mode='w', delay=True)
 	file_log_full.setFormatter(formatter)
-	file_log_full.setLevel(logging.INFO)
-	file_log_full.addFilter(NoProgressFilter())
-	logger.addHandler(file_log_full)
+	# batch the writes, errors and the interpreter shutdown flush them right away
+	file_log_buffer = logging.handlers.MemoryHandler(capacity=200, flushLevel=logging.ERROR, target=file_log_full)
+	file_log_buffer.setLevel(logging.INFO)
+	file_log_buffer.addFilter(NoProgressFilter())
+	logger.addHandler(file_log_buffer)
 
-	file_log_errors = logging.FileHandler(os.path.join(root, "job_errors.log"), mode='a')
+	file_log_errors = logging.FileHandler(os.path.join(root, "job_errors.log"), mode='a', delay=True)
 	file_log_errors.setFormatter(formatter)
 	file_log_errors.setLevel(logging.ERROR)
 	logger.addHandler(file_log_errors)
@@ -46,17 +82,24 @@ class LogHandler(logging.StreamHandler):
 	"""
 	Custom log handler that supports inline updates using carriage returns.
 	When a log message ends with '<rf>', it will update the same line.
+	The next regular message moves on to a new line, keeping the last update visible.
 	"""
+	inline = False
+
 	def emit(self, record):
 		try:
 			msg = self.format(record)
+			write = sys.stdout.write
 			# If the message ends with the special marker, update inline.
 			if msg.endswith('<rf>'):
-				msg = msg.replace('<rf>', '')
-				sys.stdout.write(f"\r{msg.ljust(120)}\r")
+				write("\r%-120s\r" % msg[:-4])
 				sys.stdout.flush()
+				self.inline = True
 			else:
-				sys.stdout.write(f"{msg}\n")
+				if self.inline:
+					write("\n")
+					self.inline = False
+				write(msg + "\n")
 		except Exception:
 			self.handleError(record)
 
@@ -65,9 +108,8 @@ class NoProgressFilter(logging.Filter):
 	Custom class to filter out progression reports in console
 	"""
 	def filter(self, record):
-		return "<rf>" not in record.getMessage() or \
-					'100%' in record.getMessage() or \
-					'completed' in record.getMessage()
+		msg = record.getMessage()
+		return not msg.endswith('<rf>') or '100%' in msg or 'completed' in msg
 
 class BackupManager():
 
@@ -78,11 +120,33 @@ class BackupManager():
 		Args:
 			client: BIMcloud API client instance.
 			storage: Google Drive API instance.
-			**kwargs: Additional parameters
+			**kwargs: Additional parameters (i.e. 'cache_path' of the metadata cache, 'force' to bypass it,
+				'workers' for the number of concurrent transfers, 'chunk_size' of the uploads in bytes,
+				'drive_folder_id' of the storage folder, 'ext_map' of file extensions by resource type)
 		"""
 		self.log = logging.getLogger('BackupManager')
 		self.client = client
 		self.storage = storage
+		self.force = kwargs.get('force', False)
+		self.workers = kwargs.get('workers', 4)
+		self.chunk_size = kwargs.get('chunk_size') or 1024*1024*8
+		self._lock = threading.Lock()
+		self._drive_name_index = None
+		self.drive_folder_id = kwargs.get('drive_folder_id') or self.storage.service_info['target_id']
+		self.ext_map = kwargs.get('ext_map') or EXTENSIONS
+
+		# invariant query parts, built once instead of on every poll tick
+		self._backup_sort_params = {'sort-by': '$time', 'sort-direction': 'desc'}
+		self._job_type_criterion = {'$eq': {'jobType': 'createProjectBackup'}}
+		self._library_format_criterion = {'$eq': {'$formatId': '_server.backup.format.bimlibrary-automatic'}}
+
+		# resource metadata of the last successful backups, keyed by resource id
+		try:
+			cache_path = kwargs.get('cache_path') or os.path.join(cache_dir(), 'backup_meta.db') # per-user, next to the token cache
+			self.meta_cache = shelve.open(cache_path)
+		except Exception as e:
+			self.log.warning(f"Metadata cache unavailable, every resource will be checked: {e}")
+			self.meta_cache = {}
 
 		self.report = {
 			'backups': 0,
@@ -90,10 +154,16 @@ class BackupManager():
 			'errors': 0
 		}
 
+	def count_error(self):
+		""" Increment the error counter of the report (thread-safe). """
+		with self._lock:
+			self.report['errors'] += 1
+
 	@staticmethod
-	def get_timeout_from_filesize(size, b=60.0, f=15.0, e=1.40, div=1000000) -> int:
+	def get_timeout_from_filesize(size, b=60.0, f=0.05, e=1.10, div=1000000) -> int:
 		"""
-		Calculate a timeout based on the file size.
+		Calculate a timeout based on the file size: b + f * (size/div)^e.
+		With the defaults: ~160 sec for 1 Gb, ~22 min for 10 Gb.
 
 		Args:
 			size (int): File size in bytes.
@@ -105,58 +175,85 @@ class BackupManager():
 		Returns:
 			int: Calculated timeout in seconds.
 		"""
-		return b + round(f * (size/div ** e), 0)
+		return b + round(f * math.pow(size / div, e), 0)
 
-	def run_with_timeout(self, fn, timeout, delay, *args, **kwargs):
+	def run_with_timeout(self, fn, timeout, delay, *args, max_delay=None, factor=1.7, jitter=False, **kwargs):
 		"""
 		Execute a function repeatedly until it returns a result or the timeout expires.
+		When max_delay is given, the delay between calls grows exponentially on each
+		miss (delay, delay*factor, ...) until it reaches max_delay. fn receives runtime,
+		timeout and reset_delay keyword arguments; calling reset_delay() when it observes
+		a state change brings the delay back to the initial one. With jitter, each wait is
+		drawn uniformly between the initial and the current delay, so polls don't line up.
 
 		Args:
 			fn (callable): The function to execute.
 			timeout (int): Maximum time in seconds to wait.
-			delay (int): Delay between function calls.
+			delay (int): Delay between function calls (initial delay when backing off).
 			*args: Positional arguments for fn.
+			max_delay (float, optional): Upper bound for the backoff delay, fixed delay if None.
+			factor (float, optional): Backoff multiplier.
+			jitter (bool, optional): Randomize the backoff delay.
 			**kwargs: Keyword arguments for fn.
 
 		Returns:
 			The result returned by fn, or None if timed out.
 		"""
-		start_time = time.time()
-		while (runtime := time.time() - start_time) < timeout:
-			kwargs.update({"runtime": runtime, "timeout": timeout})
+		start_time = time.monotonic()
+		next_delay = delay
+
+		def reset_delay():
+			nonlocal next_delay
+			next_delay = delay
+
+		while (runtime := time.monotonic() - start_time) < timeout:
+			kwargs.update({"runtime": runtime, "timeout": timeout, "reset_delay": reset_delay})
 			if result := fn(*args, **kwargs):
 				return result
-			time.sleep(delay)
-		print ('', flush=True)
+			wait = random.uniform(delay, next_delay) if jitter else next_delay
+			time.sleep(min(wait, max(timeout - (time.monotonic() - start_time), 0)))
+			if max_delay:
+				next_delay = min(next_delay * factor, max_delay)
 		self.log.error(f"Process timed out! Skipped. ({fn.__name__} {args})")
-		self.report['errors'] += 1
+		self.count_error()
 		return None
 
 	def backup(self, ids=[]) -> None:
 		"""
 		Start the resource backup procedure.
-		Iterates over resources and processes them based on type.
+		Triggers new backups for all outdated resources first, then awaits them
+		together and transfers the validated ones to the storage.
 		"""
 		resources = self.get_resources(ids)
 		if not resources:
 			self.log.info("No resources found.")
-			self.report['errors'] += 1
+			self.count_error()
 			return
 
 		self.log.info(f"Found resources: {len(resources)}, starting backup process...")
 		i, backups_created = 0, 0
+		pending, timeout_total = {}, 0
+
+		# remove all schedules if required
+		_ = self.delete_resource_schedules([resource['id'] for resource in resources])
+
+		# existing backups of the resources that may need a new one, fetched at once
+		existing = self.get_backups_by_resource([r['id'] for r in resources if not self.is_unchanged(r)])
+
 		for resource in resources:
 			i += 1
 			self.log.info(f"Resource #{i}:")
 			self.log.info(f"{resource['id']} ({resource['type']}: \"{resource['name']}\", {round(resource['$size']/1024 **2, 2)} Mb)")
 			timeout = self.get_timeout_from_filesize(resource['$size'])
-			
-			# remove all schedules if required
-			_ = self.delete_resource_schedules(resource['id'])
+
+			# nothing changed since the last backup
+			if self.is_unchanged(resource):
+				self.log.info(f"Resource is unchanged since the last backup, skipped")
+				continue
 
 			# check backups
 			has_outdated_backup = True
-			backups = self.client.get_resource_backups([resource['id']], params={'sort-by': '$time', 'sort-direction': 'desc'}) or []
+			backups = existing.get(resource['id'], [])
 			if 	(backups and backups[0].get('$time') >= resource.get('$modifiedDate')) or \
 				(not backups and resource.get('$modifiedDate') == resource.get('$uploadedTime')): # special for libs
 				has_outdated_backup = False
@@ -164,56 +261,122 @@ class BackupManager():
 			# create new, remove old
 			if has_outdated_backup:
 				start_time = time.time()
-				result, backup_new = None, None
+				job_id = None
 
 				if resource['type'] == 'project':
-					for bcp in backups:
-						if bcp and bcp.get('$time') <= resource['$modifiedDate']:
-							delete_backup_r = self.delete_project_backup(resource['id'], bcp['id'])
-							self.log.info(f"Deleted: {len(backups)} backups, {delete_backup_r}")
+					outdated = [bcp['id'] for bcp in backups if bcp and bcp.get('$time') <= resource['$modifiedDate']]
+					_ = self.delete_project_backups(resource['id'], outdated)
 					project_create_r = self.create_project_backup(resource['id'])
-					result = self.run_with_timeout(self.is_project_backup_created, timeout, 1, project_create_r['id'])
-					if result:
-						backup_new = self.is_project_backup_valid(result, start_time)
+					if not project_create_r:
+						continue
+					job_id = project_create_r['id']
 
 				if resource['type'] == 'library':
 					library_invoke_r = self.invoke_library_backup(resource['id'], start_time )
-					result = self.run_with_timeout(self.is_library_backup_created, timeout, 1, resource['id'], start_time)
-					schedule_delete_r = self.delete_resource_schedules(resource['id'])
-					if result:
-						backup_new = self.is_library_backup_valid(resource['id'], result['id'], start_time)
-
-				if backup_new:
-					self.log.info(f"Backup successfully created.")
-					upload = self.transfer_backup(resource, backup_new['id'])
-					if upload:
-						backups_created += 1
+
+				# server handles backups one by one, so the later ones have to wait for the former
+				timeout_total += timeout
+				pending[resource['id']] = {
+					'resource': resource,
+					'job_id': job_id,
+					'start_time': start_time,
+					'criterion': self._new_backup_criterion(resource, start_time),
+					'expires': time.monotonic() + timeout_total,
+				}
+
+				# don't hurry up, pace the triggers only
+				time.sleep(1)
 			else:
 				self.log.info(f"Resource has valid backup, skipped")
 
-			# don't hurry up
-			time.sleep(1)
+		# await all backups at once, transferring the completed ones meanwhile
+		if pending:
+			self.log.info(f"Awaiting backups: {len(pending)}...")
+			with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='transfer') as executor:
+				transfers = []
+				def ready(resource, backup):
+					transfers.append(executor.submit(self._transfer_one, resource, backup))
+				timeout = max(p['expires'] for p in pending.values()) - time.monotonic()
+				_ = self.run_with_timeout(self.await_backups, timeout + 60, 0.5, pending, ready, max_delay=30, jitter=True)
+				for resource_id, p in pending.items():
+					self.log.error(f"Backup timed out! Skipped. ({resource_id})")
+					if p['resource']['type'] == 'library':
+						_ = self.delete_resource_schedules([resource_id])
+
+				for future in as_completed(transfers):
+					if future.result():
+						backups_created += 1
 
 		self.report['backups'] = backups_created
 		self.report['endtime'] = time.time()
 
+	def _transfer_one(self, resource: dict, backup: dict) -> bool:
+		"""
+		Transfer a single validated backup and remember it in the metadata cache.
+		Runs on a worker thread of the transfer pool.
+
+		Returns:
+			bool: True if the backup was uploaded.
+		"""
+		try:
+			self.log.info(f"[{resource['name']}] Transferring backup of {resource['id']}...")
+			if not self.transfer_backup(resource, backup):
+				return False
+			with self._lock:
+				self.meta_cache[resource['id']] = {
+					'$modifiedDate': resource.get('$modifiedDate'),
+					'last_backup_time': backup.get('$time'),
+					'last_backup_id': backup['id'],
+					'drive_folder_id': self.drive_folder_id,
+					'version': self.client.version,
+				}
+			return True
+		except Exception as e:
+			self.log.error(f"[{resource['name']}] Transfer error: {e}, ({resource['id']})", exc_info=True)
+			self.count_error()
+			return False
+
+	def is_unchanged(self, resource: dict) -> bool:
+		"""
+		Checks whether the resource wasn't modified since its last transferred backup.
+		A backup made to another Drive folder or under another server version doesn't count, the file would be missing there.
+		"""
+		if self.force:
+			return False
+		cached = self.meta_cache.get(resource['id'])
+		return bool(cached) \
+			and cached['$modifiedDate'] == resource.get('$modifiedDate') \
+			and cached.get('drive_folder_id') == self.drive_folder_id \
+			and cached.get('version') == self.client.version
+
+	def get_backups_by_resource(self, resource_ids: list) -> dict:
+		"""
+		Retrieve the backups of several resources with a single query.
+
+		Args:
+			resource_ids (list): The resource IDs.
+
+		Returns:
+			dict: Lists of backups by resource id, newest first.
+		"""
+		if not resource_ids:
+			return {}
+		backups = self.client.get_resource_backups(resource_ids, params=self._backup_sort_params) or []
+		return self._group_by_resource(backups)
+
+	def close(self):
+		""" Flush and close the metadata cache. """
+		if isinstance(self.meta_cache, shelve.Shelf):
+			self.meta_cache.close()
+
 	def get_resources(self, ids: str):
 		"""	Retrieves resources from bimcloud storage. """
-		params = { 'sort-by': '$time', 'sort-direction': 'desc' }
+		params = self._backup_sort_params
 		if ids:
 			result = self.client.get_resources_by_id_list([ids], params)
-			if result:
-				return result
-			return None
-		return self.client.get_resources_by_criterion(
-			{
-				'$or': [
-					{'$eq': {'type': 'project'}},
-					{'$eq': {'type': 'library'}},
-				]
-			},
-			params
-		)
+		else:
+			result = self.client.get_resources_by_criterion(_RESOURCE_CRITERION, params)
+		return result or None
 
 	def create_project_backup(self, resource_id: str):
 		"""	Creates a new backup for project resource. """
@@ -225,53 +388,140 @@ class BackupManager():
 		)
 		if not response or not response.get('id'):
 			self.log.error(f"Failed to initiate backup.")
-			self.report['errors'] += 1
+			self.count_error()
 			return None
 		return response
 
-	def is_project_backup_created(self, job_id, **kwargs):
-		"""	Checks backup completion status. """
+	def await_backups(self, pending: dict, ready, **kwargs):
+		"""
+		Check all pending backups with a single query per tick and hand over the completed ones.
+		Resolved entries are removed from pending, validated backups are passed to ready.
+
+		Args:
+			pending (dict): Pending backup states by resource id.
+			ready (callable): Called with (resource, backup) for each validated backup.
+			**kwargs: Additional keyword arguments (e.g. runtime, timeout, reset_delay).
+
+		Returns:
+			bool: True when there are no pending backups left.
+		"""
+		now = time.monotonic()
+		jobs = self.get_project_backup_jobs([p['job_id'] for p in pending.values() if p['job_id']])
+		self.log.info("> awaiting %d backups, runtime: %.0f/%.0f sec<rf>", len(pending), kwargs.get('runtime'), kwargs.get('timeout'))
+
+		# project backups are checked once their jobs are finished, library ones are looked up directly
+		checks = {}
+		for resource_id, p in pending.items():
+			if not p['job_id']:
+				checks[resource_id] = p
+				continue
+			job = jobs.get(p['job_id'])
+			if job and job.get('status') != p.get('status'):
+				p['status'] = job.get('status')
+				kwargs['reset_delay']() # queued -> running -> done, the next step may be close
+			if job and job['status'] in ['completed', 'failed']:
+				checks[resource_id] = p
+		backups = self.get_new_backups(checks) if checks else {}
+
+		for resource_id, p in checks.items():
+			resource = p['resource']
+			if resource['type'] == 'project':
+				backup = self.is_project_backup_valid(backups.get(resource_id))
+			else:
+				backup = self.is_library_backup_valid(backups.get(resource_id))
+			if backup:
+				self.log.info(f"Backup successfully created. ({resource_id})")
+				ready(resource, backup)
+			elif resource['type'] == 'project':
+				self.log.error(f"Backup failed! Skipped. ({resource_id}, {jobs[p['job_id']]['status']})")
+				self.count_error()
+			else:
+				# library backup is not there or not done yet
+				latest = (backups.get(resource_id) or [{}])[0]
+				if latest.get('$statusId') != p.get('status'):
+					p['status'] = latest.get('$statusId')
+					kwargs['reset_delay']()
+				continue
+			del pending[resource_id]
+			if resource['type'] == 'library':
+				_ = self.delete_resource_schedules([resource_id])
+
+		# give up on the ones exceeding their time
+		for resource_id, p in list(pending.items()):
+			if now >= p['expires']:
+				self.log.error(f"Process timed out! Skipped. ({resource_id})")
+				self.count_error()
+				del pending[resource_id]
+				if p['resource']['type'] == 'library':
+					_ = self.delete_resource_schedules([resource_id])
+
+		return not pending
+
+	def get_project_backup_jobs(self, job_ids: list) -> dict:
+		"""	Retrieves backup jobs by their ids. """
+		if not job_ids:
+			return {}
 		jobs = self.client.get_jobs(
 			criterion={
 				'$and': [
-					{'$eq': {'jobType': 'createProjectBackup'}},
-					{'$eq': {'id': job_id}}
+					self._job_type_criterion,
+					{'$or': [{'$eq': {'id': job_id}} for job_id in job_ids]}
 				]
 			},
-			params = {
-				'sort-by': '$time',
-				'sort-direction': 'desc'
-			}
+			params = self._backup_sort_params
 		)
-		if jobs and not isinstance(jobs, str):
-			job = jobs[0]
-			self.log.info(f"> {job['status']}: {job['progress']['current']}/{job['progress']['max']}, runtime: {round(kwargs.get('runtime'))}/{round(kwargs.get('timeout'))} sec<rf>")
-			if job['status'] in ['completed', 'failed']:
-				print ('', flush=True)
-				return job
-		return None
+		if not jobs or isinstance(jobs, str):
+			return {}
+		return {job['id']: job for job in jobs}
+
+	def get_new_backups(self, pending: dict) -> dict:
+		"""
+		Retrieve backups created since the start of each pending backup with a single query.
+
+		Args:
+			pending (dict): Pending backup states by resource id.
 
-	def is_project_backup_valid(self, job, start_time):
+		Returns:
+			dict: Lists of backups by resource id, newest first.
+		"""
+		backups = self.client.get_resource_backups(
+			list(pending),
+			criterion = {'$or': [p['criterion'] for p in pending.values()]},
+			params = self._backup_sort_params
+		) or []
+		return self._group_by_resource(backups)
+
+	@staticmethod
+	def _group_by_resource(backups: list) -> dict:
+		"""	Groups a list of backups by their resource id, keeping the order. """
+		result = {}
+		for backup in backups:
+			result.setdefault(backup.get('$resourceId'), []).append(backup)
+		return result
+
+	def _new_backup_criterion(self, resource: dict, start_time: float) -> dict:
+		"""	Builds the criterion matching backups of a resource made since start_time. """
+		if resource['type'] == 'library':
+			return {
+				'$and': [
+					{'$eq': {'$resourceId': resource['id']}},
+					self._library_format_criterion,
+					{'$gte': {'$time': start_time*1000}} # ensure that it's exactly ours
+				]
+			}
+		return {
+			'$and': [
+				{'$eq': {'$resourceId': resource['id']}},
+				{'$gte': {'$time': start_time}}
+			]
+		}
+
+	def is_project_backup_valid(self, backups):
 		"""	Validates created backup by checking it's existing & props. """
-		if job:
-			resource_id = next((x.get('value') for x in (job.get('properties') or []) if x.get('name') == 'projectId'), None)
-			backups = self.client.get_resource_backups(
-				[resource_id],
-				criterion = {
-					'$and': [
-						{'$eq': {'$resourceId': resource_id}},
-						{'$gte': {'$time': start_time}}
-					]
-				},
-				params = {
-					'sort-by': '$time',
-					'sort-direction': 'desc'
-				}
-			)
-			if backups:
-				backup = backups[0]
-				if backup.get('$statusId') == '_server.backup.status.done' and backup.get('$fileSize', 0) > 0:
-					return backup
+		if backups:
+			backup = backups[0]
+			if backup.get('$statusId') == '_server.backup.status.done' and backup.get('$fileSize', 0) > 0:
+				return backup
 		return None
 
 	def delete_project_backup(self, resource_id, backup_id):
@@ -288,6 +538,26 @@ class BackupManager():
 		response = self.client.delete_resource_backup(resource_id, backup_id)
 		return response
 
+	def delete_project_backups(self, resource_id: str, backup_ids: list, max_workers: int = 8) -> list:
+		"""
+		Delete several backups of a project.
+		The deletes are independent, so they are sent concurrently over the pooled session.
+
+		Args:
+			resource_id (str): The resource ID.
+			backup_ids (list): The backup IDs.
+			max_workers (int, optional): Maximum number of concurrent delete requests.
+
+		Returns:
+			list: The deletion responses.
+		"""
+		if not backup_ids:
+			return []
+		with ThreadPoolExecutor(max_workers=min(max_workers, len(backup_ids))) as executor:
+			results = list(executor.map(lambda backup_id: self.delete_project_backup(resource_id, backup_id), backup_ids))
+		self.log.info(f"Deleted: {len(backup_ids)} backups")
+		return results
+
 	def invoke_library_backup(self, resource_id, action_time, offset=10, interval=3600):
 		"""
 		Trigger the scheduler to create an automatic library backup.
@@ -315,149 +585,189 @@ class BackupManager():
 			self.log.error(f"Response error: {e}", exc_info=True)
 			return None
 
-	def is_library_backup_created(self, resource_id, action_time, **kwargs):
-		backups = self.client.get_resource_backups(
-			[resource_id],
-			criterion = {
-				'$and': [
-					{'$eq': {'$resourceId': resource_id}},
-					{'$eq': {'$formatId': '_server.backup.format.bimlibrary-automatic'}},
-					{'$gte': {'$time': action_time*1000}} # ensure that it's exactly ours
-				]
-			},
-			params = {
-				'sort-by': '$time',
-				'sort-direction': 'desc'
-			}
-		)
-		self.log.info(f"> awaiting auto backup, runtime: {round(kwargs.get('runtime'))}/{round(kwargs.get('timeout'))} sec<rf>")
+	def is_library_backup_valid(self, backups):
+		""" Validate a library backup by checking its status & props. """
 		if backups:
 			backup = backups[0]
-			if backup.get('$time') >= action_time:
-				print ('', flush=True)
+			if backup.get('$statusId') == '_server.backup.status.done' and backup.get('$fileSize', 0) > 0:
 				return backup
 		return None
 
-	def is_library_backup_valid(self, resource_id, backup_id, start_time):
-		""" Validate a library backup by comparing its properties. """
-		backups = self.client.get_resource_backups(
-			[resource_id],
-			criterion = {
-				'$and': [
-					{'$eq': {'$resourceId': resource_id}},
-					{'$eq': {'$formatId': '_server.backup.format.bimlibrary-automatic'}},
-					{'$gte': {'$time': start_time}}
-				]
-			},
-			params = {
-				'sort-by': '$time',
-				'sort-direction': 'desc'
-			}
-		)
-		if backups:
-			backup = backups[0]
-			if backup.get('id') == backup_id and backup.get('$statusId') == '_server.backup.status.done' and backup.get('$fileSize', 0) > 0:
-				return backup
-		return False
+	def delete_resource_schedules(self, resource_ids: list, max_workers: int = 8) -> list:
+		"""
+		Delete backup schedules of the given resources.
+		The schedules of all resources are fetched with a single query, the deletes are independent,
+		so they are sent concurrently over the pooled session.
 
-	def delete_resource_schedules(self, resource_id: str):
-		""" Delete backup schedules for a specific resource. """
-		schedule_delete_r = None
-		schedules = self.client.get_resource_backup_schedules({'$eq': {'targetResourceId': resource_id}})
-		if schedules:
-			for s in schedules:
-				if s and not isinstance(s, str):
-					schedule_delete_r = self.client.delete_resource_backup_schedule(s['id'])
-			self.log.info(f"Deleted: {len(schedules)} schedules")
-			if schedule_delete_r:
-				return schedule_delete_r
-			return None
+		Args:
+			resource_ids (list): The resource IDs.
+			max_workers (int, optional): Maximum number of concurrent delete requests.
 
-	def get_backup_data(self, resource_id: str, backup_id: str, timeout: int = 300, max_retries: int = 1) -> bytes | None:
+		Returns:
+			list: The deletion responses.
 		"""
-		Retrieve backup data from BIMcloud by streaming the response.
+		if not resource_ids:
+			return []
+		schedules = self.client.get_resource_backup_schedules(
+			{'$or': [{'$eq': {'targetResourceId': resource_id}} for resource_id in resource_ids]}
+		)
+		schedule_ids = [s['id'] for s in schedules or [] if s and not isinstance(s, str)]
+		if not schedule_ids:
+			return []
+		self.log.debug("Schedules to delete: %s", schedule_ids)
+		with ThreadPoolExecutor(max_workers=min(max_workers, len(schedule_ids))) as executor:
+			results = list(executor.map(self.client.delete_resource_backup_schedule, schedule_ids))
+		self.log.info(f"Deleted: {len(schedule_ids)} schedules")
+		return results
+
+	def get_backup_data(self, resource_id: str, backup_id: str, timeout: int = 300, max_retries: int = 3) -> tempfile.SpooledTemporaryFile | None:
+		"""
+		Retrieve backup data from BIMcloud by streaming the response into a temporary file.
+		The file is kept in memory up to 64 Mb and spills to disk beyond that.
+		Failed requests are retried with an exponential backoff, a download that ran out of time is not.
 
 		Args:
 			resource_id (str): The resource ID.
 			backup_id (str): The backup ID.
 			timeout (int, optional): The request timeout in seconds.
+			max_retries (int, optional): Maximum number of download attempts.
 
 		Returns:
-			bytes: The downloaded backup data, or None if timed out.
+			SpooledTemporaryFile: The downloaded backup data rewound to start, or None if it failed.
 		"""
 		content = None
 		retries = 0
 
-		while not content and retries < max_retries:
+		while content is None and retries < max_retries:
+			if retries:
+				delay = min(2 ** retries, 30)
+				self.log.warning(f"Retrying download in {delay} sec... ({resource_id})")
+				time.sleep(delay)
+			retries += 1
+			buf = tempfile.SpooledTemporaryFile(max_size=64*1024*1024)
+			done, timed_out = threading.Event(), threading.Event()
 			try:
 				response = self.client.download_backup(resource_id, backup_id, timeout=timeout, stream=True)
 				total_length = int(response.headers.get('content-length', 0))
-				downloaded = 0
-				chunks = []
-				start_time = time.time()
-				last = start_time
-				
-				if response.ok:
-					for chunk in response.iter_content(chunk_size=1024*128): # 256 kb
-						if chunk:
-							chunks.append(chunk)
-							downloaded += len(chunk)
-							now = time.time()
-							runtime = now - start_time
-							if runtime > timeout:
-								self.log.error(f"Error (timeout?) during download ({resource_id})", exc_info=True)
-								self.report['errors'] += 1
-								return None
-							self.log.info(f"> receiving {round(downloaded/total_length*100)}%, runtime: {round(runtime)}/{round(timeout)} sec<rf>")
-							last = now
-
-					content = b''.join(chunks)
-					self.log.info(f"> received {round(downloaded/total_length*100)}%, runtime: {round(runtime)}/{round(timeout)} sec<rf>")
-					print ('', flush=True)
+				start_time = time.monotonic()
+
+				# the copy loop runs in C, progress & timeout are watched from aside
+				sampler = threading.Thread(
+					target=self._progress_sampler,
+					args=(response, buf, resource_id, total_length, start_time, timeout, done, timed_out),
+					daemon=True
+				)
+				sampler.start()
+				response.raw.decode_content = True
+				shutil.copyfileobj(response.raw, buf, length=1024*1024)
+				done.set()
+				sampler.join()
+
+				downloaded = buf.tell()
+				runtime = time.monotonic() - start_time
+				if timed_out.is_set(): # cancelled by the sampler, another attempt would take as long
+					self.log.error(f"Download timed out! Skipped. ({resource_id})") # counted by the caller
+					buf.close()
+					return None
+				if downloaded < total_length:
+					raise RuntimeError(f"incomplete download, {downloaded}/{total_length} bytes")
+
+				buf.seek(0)
+				content = buf
+				self.log.info("> %s: received %.0f%%, runtime: %.0f/%.0f sec<rf>", resource_id, downloaded/total_length*100 if total_length else 100, runtime, timeout)
 
 			except Exception as e:
-				self.log.error(f"Error during backup download: {e}, ({resource_id})", exc_info=True)
-				self.report['errors'] += 1
-				return None
+				done.set()
+				if timed_out.is_set(): # the read failed because the sampler closed the response
+					self.log.error(f"Download timed out! Skipped. ({resource_id})") # counted by the caller
+					buf.close()
+					return None
+				self.log.warning(f"Error during backup download: {e}, ({resource_id})", exc_info=True)
+
+			if content is None:
+				buf.close()
+
+		if content is None:
+			self.log.error(f"Download failed after {retries} attempts. ({resource_id})") # counted by the caller
+		return content
 
-			retries += 1
+	def _progress_sampler(self, response, buf, label, total_length, start_time, timeout, done, timed_out, interval=1.0):
+		"""
+		Report the download progress once per interval until the done event is set.
+		Closes the response when the download exceeds its timeout, which cancels the copy;
+		the timed_out event is set beforehand, so the downloading thread can tell it from a failure.
 
-		return content
+		Args:
+			response (requests.Response): The streamed download response.
+			buf: The file object the response is copied into.
+			label (str): Prefix of the progress lines.
+			total_length (int): Expected size in bytes, 0 if unknown.
+			start_time (float): Start of the download, on the monotonic clock.
+			timeout (int): Maximum time in seconds for the download.
+			done (threading.Event): Set by the downloading thread when the copy is over.
+			timed_out (threading.Event): Set here when the download is cancelled for its timeout.
+			interval (float, optional): Seconds between reports.
+		"""
+		while not done.wait(interval):
+			runtime = time.monotonic() - start_time
+			if runtime > timeout:
+				timed_out.set()
+				response.close()
+				return
+			if total_length:
+				self.log.info("> %s: receiving %.0f%%, runtime: %.0f/%.0f sec<rf>", label, buf.tell()/total_length*100, runtime, timeout)
+
+	def get_drive_file_id(self, name: str):
+		"""
+		Look up a file in the storage folder by name.
+		The folder is listed once per run and indexed by file name.
+
+		Returns:
+			str: The file ID, or None if there's no such file yet.
+		"""
+		with self._lock:
+			if self._drive_name_index is None:
+				files = self.storage.get_folder_resources(self.drive_folder_id)
+				self._drive_name_index = {f['name']: f['id'] for f in files}
+			return self._drive_name_index.get(name)
 
-	def transfer_backup(self, resource: dict, backup_id: str):
+	def transfer_backup(self, resource: dict, backup: dict):
 		"""
 		Retrieve backup data from BIMcloud and upload it to Google Drive.
 
 		Args:
-			resource_name (str): The resource name.
-			resource_id (str): The resource ID.
-			resource_size (int): The resource file size.
-			backup_id (str): The backup ID.
+			resource (dict): The resource.
+			backup (dict): The validated backup of the resource.
 
 		Returns:
-			None
+			bool: True if uploaded, None/False otherwise.
 		"""
-		self.log.info(f"Get contents and save to the cloud...")
-		timeout = self.get_timeout_from_filesize(resource['$size'], e=1.30) # adjusting for google
-		data = self.get_backup_data(resource['id'], backup_id, timeout)
+		self.log.info(f"[{resource['name']}] Get contents and save to the cloud...")
+		size = backup.get('$fileSize') or resource['$size'] # the backup is what's actually transferred
+		timeout = self.get_timeout_from_filesize(size, e=1.20) # adjusting for google
+		data = self.get_backup_data(resource['id'], backup['id'], timeout)
 		if not data:
 			self.log.error(f"Failed to retreive backup data! Skipped. ({resource['id']})")
-			self.report['errors'] += 1
+			self.count_error()
 			return None
-		files = self.storage.get_folder_resources('1XKPjCnJJUunDn67wMgcQUoYargTmrOJ0')
-		name = resource['name']+'.bim'+resource['type'] + str(self.client.version)
-		match_file = next((f for f in files if f['name'] == name), None)
-		match_file_id = match_file['id'] if match_file else None
-		request = self.storage.prepare_upload(
-			data,
-			file_name = name,
-			file_id = match_file_id,
-			resource_id = resource['id']
-		)
-		del data # just for case, considering large files
-		upload = self.run_with_timeout(self.storage.upload_chunks, timeout, 0.05, request)
+		name = resource['name'] + self.ext_map[resource['type']] + str(self.client.version)
+		match_file_id = self.get_drive_file_id(name)
+		try:
+			request = self.storage.prepare_upload(
+				data,
+				file_name = name,
+				file_id = match_file_id,
+				resource_id = resource['id'],
+				parent_id = self.drive_folder_id,
+				chunk_size = self.chunk_size
+			)
+			upload = self.run_with_timeout(self.storage.upload_chunks, timeout, 0.05, request, label=resource['id'])
+		finally:
+			data.close() # drops the spooled file from memory or disk
 		if upload:
-			self.log.info(f"Successfully uploaded to the cloud. ({upload['id']})")
+			with self._lock:
+				self._drive_name_index[name] = upload['id']
+			self.log.info(f"[{resource['name']}] Successfully uploaded to the cloud. ({upload['id']})")
 			return True
 
 		return False
@@ -465,8 +775,9 @@ class BackupManager():
 
 if __name__ == "__main__":
 
-	start_time = time.time()
+	start_time = time.monotonic()
 	errors = 0
+	status = 'Fail'
 
 	cmd = argparse.ArgumentParser()
 	# cloud
@@ -475,17 +786,24 @@ if __name__ == "__main__":
 	cmd.add_argument('-u', '--user', required=True, help='User Login')
 	cmd.add_argument('-p', '--password', required=True, help='User Password')
 	cmd.add_argument('-r', '--resource', required=False, help='Resource Id')
+	cmd.add_argument('-f', '--force', required=False, choices=['y', 'n'], default='n', help='Ignore cached metadata and check all resources')
 	# drive
 	cmd.add_argument('-k', '--cred_path', required=True, help='Path to credentials')
+	cmd.add_argument('-g', '--gd_folder_id', required=False, help='Google Drive folder Id (defaults to the target_id of credentials)')
+	cmd.add_argument('-s', '--chunk_size', required=False, type=positive_int, default=8, help='Upload chunk size, Mb')
 	# notion
 	cmd.add_argument('-n', '--notion', required=False, choices=['y', 'n'], default='y', help='Enable Notion reporting')
 	arg = cmd.parse_args()
 
-	log, cloud, drive, notion, manager = setup(arg)
+	try:
+		log, cloud, drive, notion, manager = setup(arg)
+	except AuthError as e:
+		# already logged; wrong credentials won't get better on a retry, so make it clear for the scheduler
+		sys.exit(2 if e.permanent else 1)
 
 	try:
 		if cloud and drive:
-			manager = BackupManager(cloud, drive)
+			manager = BackupManager(cloud, drive, force=arg.force == 'y', drive_folder_id=arg.gd_folder_id, chunk_size=arg.chunk_size*1024*1024)
 			manager.backup(arg.resource)
 			status = "Done" if manager.report.get('errors', 0) == 0 else "Error"
 		else:
@@ -498,7 +816,7 @@ if __name__ == "__main__":
 		status = 'Fail'
 
 	finally:
-		stop_time = time.time()
+		stop_time = time.monotonic()
 		report_payload = {
 			'items': manager.report.get('backups', 0) if manager else 0,
 			'time': round(stop_time - start_time),
@@ -506,7 +824,14 @@ if __name__ == "__main__":
 			'status': status,
 			'version': cloud.version,
 		}
+		# release the cache and the BIMcloud session first, a failing report must not keep them open
+		if manager:
+			manager.close()
+		cloud.close_session()
 		if notion and arg.notion != 'n':
 			logging.getLogger('BackupManager').info(f"Sending report...")
-			report = notion.send_report(data=report_payload)
+			try:
+				notion.send_report(data=report_payload)
+			except Exception as e:
+				log.error(f"Report error: {e}", exc_info=True)
 		log.info(f"Finished in {round(stop_time-start_time)} sec")
\ No newline at end of file
@@ -1,3 +1,5 @@
-from .bimcloud import BIMcloudAPI
+from .bimcloud import AuthError, BIMcloudAPI
 from .drive import GoogleDriveAPI
-from .notion import NotionAPI
\ No newline at end of file
+from .notion import NotionAPI
+from .cache import cache_dir
+from ._json import dumps, loads
\ No newline at end of file
@@ -0,0 +1,14 @@
+import json
+
+try:
+	import orjson
+except ImportError: # optional speedup, the standard library is used otherwise
+	orjson = None
+
+def loads(data: bytes):
+	""" Decode JSON bytes, using orjson when available. """
+	return orjson.loads(data) if orjson else json.loads(data)
+
+def dumps(obj) -> bytes:
+	""" Encode an object to compact JSON bytes, using orjson when available. """
+	return orjson.dumps(obj) if orjson else json.dumps(obj, separators=(',', ':')).encode('utf-8')
@@ -1,11 +1,29 @@
+import hashlib
 import json
 import logging
+import os
 import requests
-import sys
+import tempfile
+import threading
 import time
 
+from types import SimpleNamespace
 from urllib3.util.retry import Retry
 
+from ._json import dumps, loads
+from .cache import cache_dir, is_private_file
+
+_FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+class AuthError(RuntimeError):
+	"""
+	Raised when the BIMcloud login fails.
+	'permanent' is set when the manager rejected the credentials (400/401/403), so retrying is pointless.
+	"""
+	def __init__(self, message, permanent=False):
+		super().__init__(message)
+		self.permanent = permanent
+
 class BIMcloudAPI():
 
 	def __init__(self, manager: str, client: str, user: str, password: str, **kwargs):
@@ -19,35 +37,65 @@ class BIMcloudAPI():
 			password (str): The password.
 		"""
 		self.log = logging.getLogger("BackupManager")
-		self.manager = manager
+		self.manager = manager.rstrip('/') # endpoint paths are appended with their leading slash
 		self.version = None
 		self._client = client
 		self._user = user
 		self._password = password
 		self._auth = None
 		self._session = None
+		self._lock = threading.Lock()
+		# endpoint urls, built once instead of on every call
+		self._urls = SimpleNamespace(
+			oauth2_token=self.manager + '/management/client/oauth2/token',
+			create_resource_backup=self.manager + '/management/latest/create-resource-backup',
+			delete_resource_backup=self.manager + '/management/latest/delete-resource-backup',
+			delete_resource_backup_schedule=self.manager + '/management/latest/delete-resource-backup-schedule',
+			get_jobs=self.manager + '/management/client/get-jobs-by-criterion',
+			download_backup=self.manager + '/management/client/download-backup',
+			get_resources_by_criterion=self.manager + '/management/client/get-resources-by-criterion',
+			get_resources_by_id_list=self.manager + '/management/client/get-resources-by-id-list',
+			get_resource_backups=self.manager + '/management/client/get-resource-backups-by-criterion',
+			get_resource_backup_schedules=self.manager + '/management/client/get-resource-backup-schedules-by-criterion',
+			get_server_info=self.manager + '/get-server-info',
+			insert_resource_backup_schedule=self.manager + '/management/client/insert-resource-backup-schedule'
+		)
+		self._token_path = self._get_token_path(self.manager + client + user)
 
 		self._r = self._setup_requests()
 		self.authorize()
 
 	def _setup_requests(self):
 		"""
-		Initialize a requests.Session with a retry adapter.
+		Initialize a requests.Session with a pooled retry adapter.
+		The session is shared by every call, so connections to the manager are kept alive.
+		Status retries (429/5xx) apply to the read-only and idempotent calls only.
 
 		Returns:
 			requests.Session: Configured session.
 		"""
 		adapter = requests.adapters.HTTPAdapter(
+			pool_connections=4,
+			pool_maxsize=16,
 			max_retries=Retry(
-				total=1,
-				backoff_factor=1,
+				total=3,
+				backoff_factor=0.5, # 0.5, 1, 2 sec, unless the server sends Retry-After
 				status_forcelist=[429, 500, 502, 503, 504],
 				allowed_methods=['GET', 'POST', 'DELETE',]
 			)
 		)
+		# calls that queue work on the server must not be resent once it may have accepted them,
+		# only connection failures (nothing sent yet) are retried there
+		once_adapter = requests.adapters.HTTPAdapter(
+			pool_connections=1,
+			pool_maxsize=4,
+			max_retries=Retry(total=3, connect=3, read=0, status=0, other=0, backoff_factor=0.5)
+		)
 		session = requests.Session()
 		session.mount("https://", adapter)
 		session.mount("http://", adapter)
+		for url in (self._urls.create_resource_backup, self._urls.insert_resource_backup_schedule):
+			session.mount(url, once_adapter) # the longest matching prefix wins
 		return session
 
 	def _refresh_token(self):
@@ -65,8 +113,10 @@ class BIMcloudAPI():
 		if now >= access_token_exp - 10:
 				response = self.oauth2_refresh()
 				response.raise_for_status()
-				auth = response.json()
+				auth = self._json(response)
 				self._auth = auth
+				self._r.headers['Authorization'] = f"Bearer {self._auth.get('access_token')}"
+				self._save_token()
 
 	def _send_request(self, method: str, url: str, **kwargs):
 		"""
@@ -77,6 +127,7 @@ class BIMcloudAPI():
 			url (str): URL to request.
 			**kwargs: Additional keyword arguments (e.g. timeout, stream, params, etc.).
 			Use the 'stream' key to indicate if the raw response should be returned.
+			The 'json' body may be given already serialized as bytes.
 
 		Returns:
 			The parsed JSON response or raw response based on the 'stream' flag.
@@ -84,12 +135,26 @@ class BIMcloudAPI():
 		Raises:
 			RuntimeError: If the HTTP response is not OK.
 		"""
-		self.refresh_on_expiration()
-		headers_extra = kwargs.pop('headers', {})
-		headers = {**{'Authorization': f"Bearer {self._auth.get('access_token')}"}, **headers_extra}
-		response = self._r.request(method.upper(), url, headers=headers, **kwargs)
+		response = self._request(method, url, **kwargs)
 		return self._take_response(response, kwargs.get('stream', False))
 
+	def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+		"""
+		Refresh the token if necessary, encode the 'json' body and send the request.
+		A request rejected with 401 (e.g. the token was revoked) is sent once more after a new login.
+		"""
+		self.refresh_on_expiration()
+		if (body := kwargs.pop('json', None)) is not None:
+			kwargs['data'] = body if isinstance(body, bytes) else dumps(body)
+			kwargs['headers'] = {'Content-Type': 'application/json', **kwargs.get('headers', {})}
+		token = self._r.headers.get('Authorization')
+		response = self._r.request(method.upper(), url, **kwargs)
+		if response.status_code == 401:
+			response.close()
+			self._reauthorize(token)
+			response = self._r.request(method.upper(), url, **kwargs)
+		return response
+
 	def _take_response(self, response: requests.Response, raw_stream: bool = False):
 		"""
 		Process the HTTP response.
@@ -106,34 +171,144 @@ class BIMcloudAPI():
 		Raises:
 			RuntimeError: If the HTTP response status is not OK.
 		"""
+		if response.ok and raw_stream:
+			return response # don't touch the content, it's consumed by the caller
 		has_content = response.content is not None and len(response.content)
 		if response.ok:
 			if has_content:
-				return response if raw_stream else response.json()
+				return self._json(response)
 			else:
 				return None
 		raise RuntimeError(f"Response Error {response}")
 
+	@staticmethod
+	def _json(response: requests.Response):
+		""" Parse the JSON body of a response. """
+		return loads(response.content)
+
+	def close_session(self):
+		""" Release pooled connections of the http session. """
+		self._r.close()
+
+	def _get_token_path(self, key: str):
+		"""
+		Build the path of the token cache file in the per-user cache directory.
+
+		Returns:
+			str: The file path, or None if there is no usable cache directory (caching is off then).
+		"""
+		try:
+			directory = cache_dir()
+		except OSError as e:
+			self.log.warning(f"Auth token caching disabled: {e}")
+			return None
+		return os.path.join(directory, f"token_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:12]}.json")
+
+	def _load_token(self):
+		"""
+		Load the auth data stored by a previous run, if its token is still valid.
+		Files that are not private to the current user are ignored.
+
+		Returns:
+			dict: Auth data, or None if there is no usable cached token.
+		"""
+		if not self._token_path:
+			return None
+		try:
+			fd = os.open(self._token_path, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+			with os.fdopen(fd, 'rb') as f:
+				if not is_private_file(f.fileno()):
+					self.log.warning(f"Ignoring the auth token cache with unsafe ownership or mode: {self._token_path}")
+					return None
+				auth = loads(f.read())
+			if auth['access_token_exp'] > time.time() + 30:
+				return auth
+		except (OSError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+			pass
+		return None
+
+	def _reauthorize(self, rejected: str):
+		"""
+		Drop the cached token and log in with the credentials again.
+		Threads rejected with the same token share a single login.
+
+		Args:
+			rejected (str): The Authorization header value the server rejected.
+
+		Raises:
+			requests.exceptions.RequestException: If the login fails.
+		"""
+		with self._lock:
+			if self._r.headers.get('Authorization') != rejected:
+				return # already renewed by another thread
+			self.log.debug("Authentication token rejected, authorizing again.")
+			if self._token_path:
+				try:
+					os.remove(self._token_path)
+				except OSError:
+					pass
+			response = self.oauth2(self._user, self._password, self._client)
+			response.raise_for_status()
+			self._auth = self._json(response)
+			self._r.headers['Authorization'] = f"Bearer {self._auth.get('access_token')}"
+			self._save_token()
+
+	def _save_token(self):
+		"""
+		Store the current auth data, readable by the owner only, for subsequent runs.
+		The data goes to a new 0600 temporary file (mkstemp: O_EXCL, no symlinks) which then replaces the cache file.
+		"""
+		if not self._token_path:
+			return
+		tmp = None
+		try:
+			fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self._token_path), prefix='.token-')
+			with os.fdopen(fd, 'wb') as f:
+				f.write(dumps(self._auth))
+			os.replace(tmp, self._token_path)
+		except OSError as e:
+			self.log.warning(f"Unable to cache the auth token: {e}")
+			if tmp:
+				try:
+					os.remove(tmp)
+				except OSError:
+					pass
+
 	def authorize(self):
 		"""
 		Authorize in BIMcloud instance.
+		A token cached by a previous run is reused while it's valid, otherwise the credentials are posted.
 
 		Returns:
 			tuple: (auth, session) dictionaries.
 
 		Raises:
-			RuntimeError: If authentication or session creation fails.
+			AuthError: If authentication or session creation fails.
 		"""
+		if auth := self._load_token():
+			self._auth = auth
+			self._r.headers['Authorization'] = f"Bearer {self._auth.get('access_token')}"
+			try:
+				info = self.get_server_info()
+				self.version = info.get('registeredMajorVersion')
+				self.log.info(f"Connected to bimcloud on: {self.manager}")
+				return
+			except Exception as e:
+				self.log.debug(f"Cached token rejected, authorizing again: {e}")
 		try:
 			response = self.oauth2(self._user, self._password, self._client)
 			response.raise_for_status()
-			self._auth = response.json()
+			self._auth = self._json(response)
+			self._r.headers['Authorization'] = f"Bearer {self._auth.get('access_token')}"
+			self._save_token()
 			info = self.get_server_info()
 			self.version = info.get('registeredMajorVersion')
 			self.log.info(f"Connected to bimcloud on: {self.manager}")
 		except Exception as e:
-			self.log.error(f"Authentication error: {e}", exc_info=True)
-			raise RuntimeError("Authentication failed") from e
+			status = getattr(getattr(e, 'response', None), 'status_code', None)
+			permanent = status in (400, 401, 403)
+			self.log.error(f"Authentication error: {e}", exc_info=not permanent)
+			raise AuthError("Authentication failed", permanent=permanent) from e
 
 	def refresh_on_expiration(self):
 		"""
@@ -143,7 +318,8 @@ class BIMcloudAPI():
 			RuntimeError: If the refresh process fails.
 		"""
 		try:
-			self._refresh_token()
+			with self._lock: # refresh token is single-use, don't let threads race for it
+				self._refresh_token()
 			self.log.debug("Authentication token refreshed.")
 		except requests.exceptions.RequestException as e:
 			self.log.error(f"Refresh error: {e}", exc_info=True)
@@ -157,8 +333,8 @@ class BIMcloudAPI():
 			'password': password,
 			'client_id': client_id
 		}
-		url = self.manager + '/management/client/oauth2/token'
-		response = self._r.post(url, data=request, headers={'Content-Type': 'application/x-www-form-urlencoded'}, timeout=30)
+		url = self._urls.oauth2_token
+		response = self._r.post(url, data=request, headers=_FORM_HEADERS, timeout=30)
 		return response
 
 	def oauth2_refresh(self):
@@ -168,69 +344,67 @@ class BIMcloudAPI():
 			'refresh_token': self._auth.get('refresh_token'),
 			'client_id': self._client
 		}
-		url = self.manager + '/management/client/oauth2/token'
-		response = self._r.post(url, data=request, headers={'Content-Type': 'application/x-www-form-urlencoded'}, timeout=30)
+		url = self._urls.oauth2_token
+		response = self._r.post(url, data=request, headers=_FORM_HEADERS, timeout=30)
 		return response
 
 	def create_resource_backup(self, resource_id, backup_type, backup_name):
 		""" Create a new backup for a resource. """
-		url = self.manager + '/management/latest/create-resource-backup'
+		url = self._urls.create_resource_backup
 		response = self._send_request('post', url,  params={'resource-id': resource_id, 'backup-type': backup_type, 'backup-name': backup_name})
 		return response
 
 	def delete_resource_backup(self, resource_id, backup_id):
 		""" Delete a specific resource backup. """
-		url = self.manager + '/management/latest/delete-resource-backup'
+		url = self._urls.delete_resource_backup
 		response = self._send_request('delete', url, params={'resource-id': resource_id, 'backup-id': backup_id})
 		return response
 
 	def delete_resource_backup_schedule(self, resource_id):
 		""" Delete backup schedules for a resource. """
-		url = self.manager + '/management/latest/delete-resource-backup-schedule'
+		url = self._urls.delete_resource_backup_schedule
 		response = self._send_request('delete', url, params={'resource-id': resource_id})
 		return response
 
 	def get_jobs(self, criterion=None, params=None):
 		""" Retrieve jobs based on given criteria. """
-		url = self.manager + '/management/client/get-jobs-by-criterion'
+		url = self._urls.get_jobs
 		response = self._send_request('post', url, params=params, json=criterion)
 		return response
 
 	def download_backup(self, resource_id, backup_id, timeout=300, stream=False):
 		""" Download a backup file from BIMcloud. """
-		url = self.manager + '/management/client/download-backup'
-		# response = self._send_request('get', url, params={'resource-id': resource_id, 'backup-id': backup_id}, timeout=timeout, stream=stream)
-		response = requests.get(url, headers={'Authorization': f"Bearer {self._auth.get('access_token')}"}, params={'resource-id': resource_id, 'backup-id': backup_id}, timeout=timeout, stream=stream)
-		return response 
+		url = self._urls.download_backup
+		response = self._send_request('get', url, params={'resource-id': resource_id, 'backup-id': backup_id}, timeout=timeout, stream=stream)
+		return response
 
 	def get_resources_by_criterion(self, criterion=None, params=None):
 		""" Retrieve resources based on a given criterion. """
-		url = self.manager + '/management/client/get-resources-by-criterion'
+		url = self._urls.get_resources_by_criterion
 		response = self._send_request('post', url, params=params, json=criterion)
 		return response
 
 	def get_resources_by_id_list(self, ids, params=None):
 		""" Retrieve resources by a list of IDs. """
-		url = self.manager + '/management/client/get-resources-by-id-list'
+		url = self._urls.get_resources_by_id_list
 		response = self._send_request('post', url, params=params, json=ids)
 		return response
 
 	def get_resource_backups(self, resources_ids, criterion=None, params=None):
 		""" Retrieve backups for given resource IDs using specific criteria. """
-		url = self.manager + '/management/client/get-resource-backups-by-criterion'
+		url = self._urls.get_resource_backups
 		response = self._send_request('post', url, params=params, json={'ids': resources_ids, 'criterion': criterion})
 		return response
 
 	def get_resource_backup_schedules(self, criterion=None):
 		""" Retrieve backup schedules based on a given criterion. """
-		url = self.manager + '/management/client/get-resource-backup-schedules-by-criterion'
+		url = self._urls.get_resource_backup_schedules
 		response = self._send_request('post', url, json=criterion)
 		return response
 
 	def get_server_info(self):
-		url = self.manager + '/get-server-info'
+		url = self._urls.get_server_info
 		response = self._send_request('get', url)
-		# response = requests.get(url, headers={'Authorization': f"Bearer {self._auth.get('access_token')}"})
 		return response
 
 	def insert_resource_backup_schedule(
@@ -262,6 +436,6 @@ class BIMcloudAPI():
 			'type': type,
 			'revision': revision
 		}
-		url = self.manager + '/management/client/insert-resource-backup-schedule'
+		url = self._urls.insert_resource_backup_schedule
 		response = self._send_request('post', url, json=schedule)
 		return response
\ No newline at end of file
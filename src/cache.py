@@ -0,0 +1,32 @@
+import os
+import stat
+
+def cache_dir() -> str:
+	"""
+	Return the per-user cache directory of the backup tool, creating it if needed.
+	The directory is private to the user (0700), files kept there hold tokens & run state.
+
+	Returns:
+		str: Path of the directory, e.g. ~/.cache/bimcloud-backup.
+
+	Raises:
+		PermissionError: If the directory exists but belongs to another user.
+	"""
+	base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+	path = os.path.join(base, 'bimcloud-backup')
+	os.makedirs(path, mode=0o700, exist_ok=True)
+	st = os.lstat(path)
+	if not stat.S_ISDIR(st.st_mode) or (hasattr(os, 'getuid') and st.st_uid != os.getuid()):
+		raise PermissionError(f"Cache directory is not owned by the current user: {path}")
+	if stat.S_IMODE(st.st_mode) & 0o077:
+		os.chmod(path, 0o700)
+	return path
+
+def is_private_file(fd: int) -> bool:
+	"""	Checks that an open file is a regular file owned by the current user and accessible to them only. """
+	st = os.fstat(fd)
+	if not stat.S_ISREG(st.st_mode):
+		return False
+	if not hasattr(os, 'getuid'): # no posix ownership & modes to check
+		return True
+	return st.st_uid == os.getuid() and stat.S_IMODE(st.st_mode) == 0o600
@@ -1,12 +1,14 @@
 import json
 import io
 import logging
-import time
+import threading
+
+import google_auth_httplib2
+import httplib2
 
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
-from googleapiclient.http import MediaFileUpload
 
 class GoogleDriveAPI():
 
@@ -26,6 +28,8 @@ class GoogleDriveAPI():
         ]
         self.service_info = None
         self.service = None
+        self._credentials = None
+        self._local = threading.local()
 
         self.authorize(cred_path, account)
 
@@ -49,38 +53,57 @@ class GoogleDriveAPI():
             service = build('drive', 'v3', credentials=credentials)
             if service:
                 self.service = service
+                self._credentials = credentials
                 self.service_info = service_account_info['google_drive']
                 self.log.info(f"Cloud storage initialized: {service._baseUrl} ({account.split('@')[0]})")
         except Exception as e:
             raise RuntimeError("Google Drive authorization failed") from e
 
+    def _http(self):
+        """
+        Return an authorized http client of the current thread.
+        httplib2 is not thread-safe, so every thread issuing requests gets its own one.
+        """
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self._credentials, http=httplib2.Http())
+            self._local.http = http
+        return http
+
     def get_folder_resources(self, folder_id):
-        """ Retrieve the list of files in a given folder. """
+        """
+        Retrieve the list of files in a given folder.
+
+        Raises:
+            RuntimeError: If the folder can't be listed.
+        """
         try:
             result = self.service.files().list(
                 q = f"'{folder_id}' in parents",
                 pageSize = 1000,
                 fields = "nextPageToken, files(id, name, modifiedTime)"
-            ).execute()
+            ).execute(http=self._http())
             return result.get('files', [])
         except Exception as e:
             self.log.error(f"Root folder error: {e}", exc_info=True)
-            sys.exit(1)
+            raise RuntimeError("Google Drive folder listing failed") from e
 
     def prepare_upload(self, data, file_name, file_id=None, **kwargs):
         """
         Prepare an upload request for a file to Google Drive.
 
         Args:
-            data (bytes): The file data.
+            data (bytes | file-like): The file data, or a seekable binary file object to stream from.
             file_name (str): The name of the file.
             file_id (str, optional): The file ID to update (if any).
-            **kwargs: Additional keyword arguments, e.g. 'resource_id' for file description.
+            **kwargs: Additional keyword arguments, e.g. 'resource_id' for file description,
+                'parent_id' of the folder for new files (defaults to the target_id of credentials),
+                'chunk_size' in bytes (a multiple of 256 Kb, defaults to 8 Mb).
 
         Returns:
             A Drive API request object ready for upload.
         """
-        file_stream = io.BytesIO(data)
+        file_stream = data if hasattr(data, 'read') else io.BytesIO(data)
         file_stream.seek(0)
         file_metadata = {
             'name': file_name,
@@ -89,7 +112,7 @@ class GoogleDriveAPI():
         media = MediaIoBaseUpload(
             file_stream,
             mimetype = 'application/octet-stream',
-            chunksize = 1024*1024*5, # 5MB is max
+            chunksize = kwargs.get('chunk_size') or 1024*1024*8, # fewer requests per file, must be a multiple of 256 Kb
             resumable = True
         )
         params = {
@@ -101,7 +124,7 @@ class GoogleDriveAPI():
             params['fileId'] = file_id
             request = self.service.files().update(**params)
         else:
-            params['body']['parents'] = [self.service_info['target_id']]
+            params['body']['parents'] = [kwargs.get('parent_id') or self.service_info['target_id']]
             request = self.service.files().create(**params)
         return request
 
@@ -111,16 +134,16 @@ class GoogleDriveAPI():
 
         Args:
             request: A resumable upload request object.
-            **kwargs: Additional keyword arguments (e.g. runtime, timeout).
+            **kwargs: Additional keyword arguments (e.g. runtime, timeout, label for progress lines).
 
         Returns:
             The final response of the upload (e.g. file metadata) upon completion.
         """
         response = None
-        status, response = request.next_chunk()
+        label = f"{kwargs['label']}: " if kwargs.get('label') else ''
+        status, response = request.next_chunk(http=self._http(), num_retries=3) # resumes from the same offset on 5xx/429
         if status:
-            self.log.info(f"> uploading: {int(status.progress() * 100)}%, runtime: {round(kwargs.get('runtime'))}/{round(kwargs.get('timeout'))} sec<rf>")
+            self.log.info("> %suploading: %d%%, runtime: %.0f/%.0f sec<rf>", label, status.progress() * 100, kwargs.get('runtime'), kwargs.get('timeout'))
         if response:
-            self.log.info(f"> uploaded: 100%, runtime: {round(kwargs.get('runtime'))}/{round(kwargs.get('timeout'))} sec<rf>")
-            print ('', flush=True)
+            self.log.info("> %suploaded: 100%%, runtime: %.0f/%.0f sec<rf>", label, kwargs.get('runtime'), kwargs.get('timeout'))
         return response
\ No newline at end of file
@@ -4,6 +4,8 @@ import requests
 
 from urllib3.util.retry import Retry
 
+from ._json import loads
+
 class NotionAPI():
 
 	def __init__(self, cred_path):
@@ -53,6 +55,7 @@ class NotionAPI():
 		# self.refresh_on_expiration()
 		headers_extra = kwargs.pop('headers', {})
 		headers = {**self._auth['headers'], **headers_extra}
+		kwargs.setdefault('timeout', 30) # reporting must not hold up the end of a run
 		response = self._r.request(method.upper(), url, headers=headers, **kwargs)
 		return self._take_response(response)
 
@@ -75,7 +78,7 @@ class NotionAPI():
 		has_content = response.content is not None and len(response.content)
 		if response.ok:
 			if has_content:
-				return response.json()
+				return loads(response.content)
 			else:
 				return None
 		raise RuntimeError(f"Response Error {response}")